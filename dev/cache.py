@@ -0,0 +1,72 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    A bounded, least-recently-used cache whose entries expire after a fixed TTL.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Returns the cached value for the key, or None if it is missing or expired.
+        """
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Stores a value, evicting the least recently used entry when full.
+        """
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns hit/miss counters and the current number of entries.
+        """
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one in-flight awaitable.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Awaits the call already running for the key, or starts it with factory().
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(factory())
+        self._inflight[key] = future
+        future.add_done_callback(lambda _f: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
@@ -32,6 +32,16 @@ def clean_status(status: Union[str, List[str]]) -> Union[Optional[str], List[str
         return status.split()[0]
     return None
 
+def clean_domain_name(name: Union[str, List[str]]) -> Optional[str]:
+    """
+    Returns the registered domain name in lower case, without a trailing dot.
+    """
+    if isinstance(name, (list, tuple)):
+        name = next((n for n in name if isinstance(n, str)), None)
+    if isinstance(name, str) and name.strip():
+        return name.strip().lower().rstrip('.')
+    return None
+
 def handle_error(message: str) -> Dict[str, str]:
     """
     Returns a structured error message.
@@ -45,6 +55,7 @@ def fetch_whois(domain: str) -> Union[Dict[str, Any], Dict[str, str]]:
     try:
         w = whois.whois(domain)
         return {
+            "Domain Name": clean_domain_name(w.domain_name),
             "Registrar": w.registrar,
             "Created Date": format_date(w.creation_date),
             "Expiry Date": format_date(w.expiration_date),
@@ -0,0 +1,444 @@
+import argparse
+import asyncio
+import importlib
+import json
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+import dns.asyncresolver
+import dns.resolver
+
+from cache import SingleFlight, TTLCache
+from domain_info_fetcher import fetch_whois, handle_error, validate_domain
+from profiling import profile_run
+
+DEFAULT_RECORD_TYPES = ['A', 'NS', 'CNAME', 'MX', 'TXT']
+MAX_BODY_SIZE = 1024 * 1024
+MAX_BATCH_SIZE = 10000
+MAX_HEADERS = 100
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    413: "Payload Too Large",
+}
+
+
+class ClientSlot:
+    """
+    A client's concurrency semaphore and the number of lookups holding or awaiting it.
+    """
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0
+
+
+class LookupService:
+    """
+    Long-running DNS/WHOIS lookup service shared by all HTTP clients.
+
+    One async resolver (with its answer cache) and one WHOIS cache are shared
+    across every request, and each client is limited to a fixed number of
+    concurrent lookups. Clients are identified by peer address; the X-Client-Id
+    header is only used when trust_client_id is set, e.g. behind a trusted
+    proxy. Point the resolver at stub servers with nameservers/port
+    and pass whois_fetcher to replace python-whois when load testing locally.
+    A client has request_timeout seconds to send its whole request.
+    """
+
+    def __init__(
+        self,
+        nameservers: Optional[List[str]] = None,
+        port: int = 53,
+        timeout: float = 5.0,
+        dns_cache_size: int = 100000,
+        whois_cache_size: int = 10000,
+        whois_ttl: float = 6 * 3600,
+        per_client_limit: int = 10,
+        whois_workers: int = 16,
+        whois_fetcher: Callable[[str], Dict[str, Any]] = fetch_whois,
+        trust_client_id: bool = False,
+        request_timeout: float = 10.0,
+    ):
+        self.resolver = dns.asyncresolver.Resolver(configure=False)
+        self.resolver.nameservers = nameservers or ['8.8.8.8', '1.1.1.1']
+        self.resolver.port = port
+        self.resolver.lifetime = timeout
+        self.resolver.cache = dns.resolver.LRUCache(dns_cache_size)
+
+        self.whois_cache = TTLCache(max_size=whois_cache_size, ttl=whois_ttl)
+        self.whois_fetcher = whois_fetcher
+        self._whois_flight = SingleFlight()
+        self._whois_slots = asyncio.Semaphore(whois_workers)
+
+        self.per_client_limit = per_client_limit
+        self.trust_client_id = trust_client_id
+        self.request_timeout = request_timeout
+        self._client_slots: Dict[str, ClientSlot] = {}
+        self.requests_served = 0
+
+    async def fetch_dns_record(self, record_type: str, domain: str) -> Union[List[str], Dict[str, str]]:
+        """
+        Fetches DNS records of a specific type through the shared resolver.
+        """
+        try:
+            answers = await self.resolver.resolve(domain, record_type)
+            return [rdata.to_text() for rdata in answers]
+        except dns.resolver.NoAnswer:
+            return handle_error(f"No {record_type} records found.")
+        except dns.resolver.NXDOMAIN:
+            return handle_error(f"Domain '{domain}' does not exist.")
+        except dns.resolver.LifetimeTimeout:
+            return handle_error("DNS query timed out. Please check your network.")
+        except Exception as e:
+            return handle_error(f"Error retrieving {record_type} records: {str(e)}")
+
+    async def fetch_dns_records(self, domain: str, record_types: List[str]) -> Dict[str, Union[List[str], str]]:
+        """
+        Fetches all requested record types for the domain concurrently.
+        """
+        results = await asyncio.gather(
+            *(self.fetch_dns_record(record_type, domain) for record_type in record_types)
+        )
+        records = {}
+        for record_type, result in zip(record_types, results):
+            if isinstance(result, dict) and 'error' in result:
+                records[record_type] = result['error']
+            else:
+                records[record_type] = result
+        return records
+
+    async def fetch_whois(self, domain: str) -> Dict[str, Any]:
+        """
+        Fetches WHOIS information through the shared cache.
+
+        python-whois is blocking, so lookups run in the default executor. Concurrent
+        requests for the same domain share a single lookup, and errors are not cached.
+        """
+        cached = self.whois_cache.get(domain)
+        if cached is not None:
+            return cached
+
+        async def lookup():
+            async with self._whois_slots:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(None, self.whois_fetcher, domain)
+            if 'error' not in result:
+                self.whois_cache.put(domain, result)
+            return result
+
+        return await self._whois_flight.run(domain, lookup)
+
+    async def lookup(
+        self,
+        client: str,
+        domain: str,
+        record_types: List[str],
+        include_whois: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        Runs a single domain lookup within the client's concurrency limit.
+        """
+        domain = normalize_domain(domain)
+        if not validate_domain(domain):
+            return {"domain": domain, **handle_error("Invalid domain format.")}
+
+        async with self.client_slot(client):
+            tasks = [self.fetch_dns_records(domain, record_types)]
+            if include_whois:
+                tasks.append(self.fetch_whois(domain))
+            results = await asyncio.gather(*tasks)
+
+        self.requests_served += 1
+        result = {"domain": domain, "dns": results[0]}
+        if include_whois:
+            result["whois"] = results[1]
+        return result
+
+    @asynccontextmanager
+    async def client_slot(self, client: str) -> AsyncIterator[None]:
+        """
+        Holds one of the client's concurrent lookup slots.
+
+        A client's semaphore only exists while it has lookups running or waiting,
+        so idle clients do not accumulate.
+        """
+        slot = self._client_slots.get(client)
+        if slot is None:
+            slot = self._client_slots[client] = ClientSlot(self.per_client_limit)
+        slot.users += 1
+        try:
+            async with slot.semaphore:
+                yield
+        finally:
+            slot.users -= 1
+            if slot.users == 0:
+                del self._client_slots[client]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns cache and traffic counters for the /stats endpoint.
+        """
+        dns_cache = self.resolver.cache
+        return {
+            "lookups": self.requests_served,
+            "clients": len(self._client_slots),
+            "dns_cache": {"size": len(dns_cache.data), "hits": dns_cache.hits(), "misses": dns_cache.misses()},
+            "whois_cache": self.whois_cache.stats(),
+        }
+
+    # HTTP handling
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serves one HTTP/1.1 request and closes the connection.
+        """
+        try:
+            request = await read_request(reader, self.request_timeout)
+            if request is None:
+                return
+            method, target, headers, body = request
+            peer = writer.get_extra_info('peername')
+            client = peer[0] if peer else 'unknown'
+            if self.trust_client_id and headers.get('x-client-id'):
+                client = headers['x-client-id']
+            await self.dispatch(writer, client, method, target, body)
+        except ValueError as e:
+            await write_json(writer, 400, handle_error(str(e)))
+        except asyncio.TimeoutError:
+            await write_json(writer, 408, handle_error("Request not received in time."))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, writer: asyncio.StreamWriter, client: str, method: str, target: str, body: bytes) -> None:
+        """
+        Routes a parsed request to the matching endpoint.
+        """
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+
+        if url.path == '/lookup':
+            if method != 'GET':
+                return await write_json(writer, 405, handle_error("Use GET for /lookup."))
+            domain = query.get('domain', [''])[0]
+            record_types = parse_record_types(query.get('types', [None])[0])
+            include_whois = parse_flag(query.get('whois', ['1'])[0])
+            result = await self.lookup(client, domain, record_types, include_whois)
+            return await write_json(writer, 200, result)
+
+        if url.path == '/batch':
+            if method != 'POST':
+                return await write_json(writer, 405, handle_error("Use POST for /batch."))
+            payload = json.loads(body or b'{}')
+            if not isinstance(payload, dict):
+                raise ValueError("Request body must be a JSON object.")
+            domains = payload.get('domains')
+            if not isinstance(domains, list) or not domains:
+                raise ValueError("Request body must contain a non-empty 'domains' list.")
+            if not all(isinstance(domain, str) for domain in domains):
+                raise ValueError("Every entry in 'domains' must be a string.")
+            if len(domains) > MAX_BATCH_SIZE:
+                return await write_json(writer, 413, handle_error(f"Batches are limited to {MAX_BATCH_SIZE} domains."))
+            record_types = parse_record_types(payload.get('types'))
+            include_whois = parse_flag(payload.get('whois', True))
+            return await self.stream_batch(writer, client, domains, record_types, include_whois)
+
+        if url.path == '/stats':
+            return await write_json(writer, 200, self.stats())
+
+        await write_json(writer, 404, handle_error(f"Unknown endpoint '{url.path}'."))
+
+    async def stream_batch(
+        self,
+        writer: asyncio.StreamWriter,
+        client: str,
+        domains: List[str],
+        record_types: List[str],
+        include_whois: bool,
+    ) -> None:
+        """
+        Streams one JSON line per domain, in completion order, as a chunked response.
+        """
+        writer.write(response_head(200, 'application/x-ndjson', chunked=True))
+        await writer.drain()
+
+        tasks = [
+            asyncio.ensure_future(self.lookup(client, domain, record_types, include_whois))
+            for domain in dict.fromkeys(map(normalize_domain, domains))
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = json.dumps(await next_done, default=str).encode() + b'\n'
+                writer.write(b'%x\r\n%s\r\n' % (len(line), line))
+                await writer.drain()
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def normalize_domain(domain: str) -> str:
+    """
+    Returns the domain in the form lookups are cached and de-duplicated under.
+    """
+    return domain.strip().lower().rstrip('.')
+
+
+def parse_record_types(value: Union[str, List[str], None]) -> List[str]:
+    """
+    Parses a comma separated string or list of record types, defaulting to all types.
+    """
+    if not value:
+        return list(DEFAULT_RECORD_TYPES)
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, list):
+        raise ValueError("Record types must be a list or a comma separated string.")
+    record_types = [str(record_type).strip().upper() for record_type in value if str(record_type).strip()]
+    if not record_types:
+        return list(DEFAULT_RECORD_TYPES)
+    return list(dict.fromkeys(record_types))
+
+
+def parse_flag(value: Union[bool, str, int, None]) -> bool:
+    """
+    Parses a boolean option given as JSON or as a query string value.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() not in ('0', 'false', 'no', 'off', '')
+    return bool(value)
+
+
+async def read_request(
+    reader: asyncio.StreamReader,
+    timeout: Optional[float] = None,
+) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """
+    Reads the request line, headers and body of a single HTTP request.
+
+    Raises asyncio.TimeoutError if the whole request does not arrive within
+    timeout seconds, so slow clients cannot hold a connection open.
+    """
+    return await asyncio.wait_for(_read_request(reader), timeout)
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, _version = request_line.decode('latin-1').split()
+    except ValueError:
+        raise ValueError("Malformed request line.")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise ValueError("Too many request headers.")
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0) or 0)
+    if length > MAX_BODY_SIZE:
+        raise ValueError("Request body too large.")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, headers, body
+
+
+def response_head(status: int, content_type: str, length: Optional[int] = None, chunked: bool = False) -> bytes:
+    """
+    Builds the status line and headers for a response.
+    """
+    lines = [
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+        f"Content-Type: {content_type}",
+        "Connection: close",
+    ]
+    if chunked:
+        lines.append("Transfer-Encoding: chunked")
+    elif length is not None:
+        lines.append(f"Content-Length: {length}")
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def write_json(writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any]) -> None:
+    """
+    Writes a complete JSON response.
+    """
+    body = json.dumps(payload, default=str).encode()
+    writer.write(response_head(status, 'application/json', length=len(body)) + body)
+    await writer.drain()
+
+
+async def serve(host: str, port: int, service: LookupService) -> None:
+    """
+    Runs the HTTP server until cancelled.
+    """
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    addresses = ', '.join(str(sock.getsockname()) for sock in server.sockets)
+    print(f"Serving domain lookups on {addresses}")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="HTTP service for shared DNS/WHOIS lookups.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8053)
+    parser.add_argument('--nameserver', action='append', dest='nameservers',
+                        help="Upstream DNS server (repeatable). Defaults to Google and Cloudflare.")
+    parser.add_argument('--dns-port', type=int, default=53, help="Port of the upstream DNS servers.")
+    parser.add_argument('--timeout', type=float, default=5.0, help="DNS query lifetime in seconds.")
+    parser.add_argument('--client-limit', type=int, default=10, help="Concurrent lookups allowed per client.")
+    parser.add_argument('--trust-client-id', action='store_true',
+                        help="Apply per-client limits by X-Client-Id instead of peer address (trusted proxies only).")
+    parser.add_argument('--whois-ttl', type=float, default=6 * 3600, help="Seconds to keep WHOIS results.")
+    parser.add_argument('--whois-fetcher', metavar='MODULE:FUNCTION',
+                        help="Function to fetch WHOIS with instead of python-whois, e.g. a local stub for load tests.")
+    parser.add_argument('--request-timeout', type=float, default=10.0,
+                        help="Seconds a client has to send its request.")
+    parser.add_argument('--profile', metavar='DIR', help="Profile the service until it stops and write a report to DIR.")
+    args = parser.parse_args(argv)
+
+    whois_fetcher = fetch_whois
+    if args.whois_fetcher:
+        module, _, function = args.whois_fetcher.partition(':')
+        if not function:
+            parser.error("--whois-fetcher must be given as MODULE:FUNCTION")
+        whois_fetcher = getattr(importlib.import_module(module), function)
+
+    async def run(profile):
+        if profile is not None:
+            profile.track_loop()
+        service = LookupService(
+            nameservers=args.nameservers,
+            port=args.dns_port,
+            timeout=args.timeout,
+            whois_ttl=args.whois_ttl,
+            per_client_limit=args.client_limit,
+            trust_client_id=args.trust_client_id,
+            whois_fetcher=whois_fetcher,
+            request_timeout=args.request_timeout,
+        )
+        await serve(args.host, args.port, service)
+
+    with profile_run(args.profile) as profile:
+        try:
+            asyncio.run(run(profile))
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
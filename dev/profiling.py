@@ -0,0 +1,322 @@
+import asyncio
+import collections.abc
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of all threads at a fixed interval.
+
+    Stacks are written in the collapsed format ('frame;frame;frame count') that
+    flamegraph.pl, speedscope and py-spy's tooling read.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path: str) -> None:
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class PeakSnapshotter:
+    """
+    Takes tracemalloc snapshots during a run and keeps the one nearest the peak.
+
+    Traced memory is checked at a fixed interval and a new snapshot replaces the
+    kept one whenever memory has grown by the given factor since it was taken,
+    so the report shows what was alive at the high-water mark rather than what
+    survived to the end of the run.
+    """
+
+    def __init__(self, interval: float = 0.5, growth: float = 1.1):
+        self.interval = interval
+        self.growth = growth
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.traced = 0
+        self.taken_at = 0.0
+        self._held = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='peak-snapshotter', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def traced_now(self) -> int:
+        """
+        Returns the traced memory in use, leaving out the kept snapshot itself.
+        """
+        return tracemalloc.get_traced_memory()[0] - self._held
+
+    def sample(self) -> None:
+        """
+        Replaces the kept snapshot if traced memory has grown enough since it was taken.
+        """
+        current = self.traced_now()
+        if self.snapshot is not None and current <= self.traced * self.growth:
+            return
+        self.snapshot = None
+        before = tracemalloc.get_traced_memory()[0]
+        snapshot = tracemalloc.take_snapshot()
+        self._held = tracemalloc.get_traced_memory()[0] - before
+        self.snapshot, self.traced, self.taken_at = snapshot, before, time.perf_counter()
+
+
+class TimedCoroutine(collections.abc.Coroutine):
+    """
+    Wraps a coroutine and measures the time spent running each of its steps.
+    """
+
+    def __init__(self, coro):
+        self._coro = coro
+        self.running = 0.0
+
+    def _step(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.running += time.perf_counter() - start
+
+    def send(self, value):
+        return self._step(self._coro.send, value)
+
+    def throw(self, *args):
+        return self._step(self._coro.throw, *args)
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+    def __getattr__(self, name):
+        return getattr(self._coro, name)
+
+
+class TaskTracker:
+    """
+    Collects per-coroutine task counts, running time and time spent waiting.
+
+    Install it as the event loop's task factory. A task's wait time is its
+    lifetime minus the time its coroutine was actually executing.
+    """
+
+    def __init__(self):
+        self.summary: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"tasks": 0, "running": 0.0, "waiting": 0.0, "max_lifetime": 0.0}
+        )
+
+    def install(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._previous = loop.get_task_factory()
+        loop.set_task_factory(self._factory)
+
+    def uninstall(self, loop: asyncio.AbstractEventLoop) -> None:
+        loop.set_task_factory(self._previous)
+
+    def _factory(self, loop, coro, **kwargs):
+        name = getattr(coro, '__qualname__', type(coro).__name__)
+        timed = TimedCoroutine(coro)
+        if self._previous is not None:
+            task = self._previous(loop, timed, **kwargs)
+        else:
+            task = asyncio.Task(timed, loop=loop, **kwargs)
+        created = time.perf_counter()
+
+        def done(_task):
+            lifetime = time.perf_counter() - created
+            entry = self.summary[name]
+            entry["tasks"] += 1
+            entry["running"] += timed.running
+            entry["waiting"] += max(lifetime - timed.running, 0.0)
+            entry["max_lifetime"] = max(entry["max_lifetime"], lifetime)
+
+        task.add_done_callback(done)
+        return task
+
+    def report(self) -> List[Dict[str, Any]]:
+        rows = [{"coroutine": name, **values} for name, values in self.summary.items()]
+        return sorted(rows, key=lambda row: row["running"] + row["waiting"], reverse=True)
+
+
+class ProfileRun:
+    """
+    Holds the collectors for one profiled run and writes them to a report directory.
+    """
+
+    def __init__(
+        self,
+        report_dir: str,
+        sample_interval: float = 0.005,
+        top_allocations: int = 25,
+        snapshot_interval: float = 0.5,
+    ):
+        self.report_dir = report_dir
+        self.top_allocations = top_allocations
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(sample_interval)
+        self.snapshots = PeakSnapshotter(snapshot_interval)
+        self.tasks = TaskTracker()
+        self.started = 0.0
+        self.elapsed = 0.0
+
+    def track_loop(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """
+        Starts collecting task and wait-time statistics for an event loop.
+        """
+        self.tasks.install(loop or asyncio.get_running_loop())
+
+    def start(self) -> None:
+        os.makedirs(self.report_dir, exist_ok=True)
+        # Only the allocating line is reported, so one frame per trace is enough.
+        tracemalloc.start(1)
+        self.sampler.start()
+        self.snapshots.start()
+        self.started = time.perf_counter()
+        self.profiler.enable()
+
+    def stop(self) -> None:
+        self.profiler.disable()
+        self.elapsed = time.perf_counter() - self.started
+        self.sampler.stop()
+        self.snapshots.stop()
+        self.snapshots.sample()
+        self.exit_memory = self.snapshots.traced_now()
+        self.exit_snapshot = tracemalloc.take_snapshot()
+        self.peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    def write_report(self) -> None:
+        """
+        Writes the profile, flamegraph stacks, allocations and task summary.
+        """
+        path = lambda name: os.path.join(self.report_dir, name)
+
+        self.profiler.dump_stats(path('profile.pstats'))
+        text = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=text)
+        stats.sort_stats('cumulative').print_stats(50)
+        stats.sort_stats('tottime').print_stats(50)
+        with open(path('profile.txt'), 'w') as f:
+            f.write(text.getvalue())
+
+        self.sampler.write(path('stacks.collapsed'))
+
+        summary = {
+            "command": sys.argv,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "stack_samples": self.sampler.samples,
+            "peak_traced_memory_kib": round(self.peak_memory / 1024, 1),
+            "peak_snapshot": {
+                "traced_memory_kib": round(self.snapshots.traced / 1024, 1),
+                "taken_at_seconds": round(self.snapshots.taken_at - self.started, 3),
+                "top_allocations": self._allocations(self.snapshots.snapshot),
+            },
+            "exit_snapshot": {
+                "traced_memory_kib": round(self.exit_memory / 1024, 1),
+                "top_allocations": self._allocations(self.exit_snapshot),
+            },
+            "asyncio_tasks": self.tasks.report(),
+        }
+        with open(path('summary.json'), 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+    def _allocations(self, snapshot: tracemalloc.Snapshot) -> List[Dict[str, Any]]:
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        return [
+            {
+                "location": str(stat.traceback[0]),
+                "size_kib": round(stat.size / 1024, 1),
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics('lineno')[:self.top_allocations]
+        ]
+
+
+@contextmanager
+def profile_run(report_dir: Optional[str], **options) -> Iterator[Optional[ProfileRun]]:
+    """
+    Profiles the enclosed block and writes a report to report_dir.
+
+    The report contains profile.pstats and profile.txt (cProfile),
+    stacks.collapsed (sampled stacks for flamegraphs) and summary.json
+    (tracemalloc top allocators near the memory peak and at exit, and the
+    asyncio task/wait-time summary). Call track_loop() on the yielded run from
+    inside the event loop to collect task statistics. When report_dir is None
+    the block runs unprofiled.
+    """
+    if report_dir is None:
+        yield None
+        return
+
+    run = ProfileRun(report_dir, **options)
+    run.start()
+    try:
+        yield run
+    finally:
+        run.stop()
+        run.write_report()
+        print(f"Profile report written to {report_dir}", file=sys.stderr)
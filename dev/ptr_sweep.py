@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import ipaddress
+import json
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import dns.asyncresolver
+import dns.resolver
+import dns.reversename
+
+from cache import TTLCache
+from profiling import profile_run
+
+ADDRESS_TYPES = ('A', 'AAAA')
+NEGATIVE_TTL = 300.0
+
+
+def normalize_address(address: str) -> Optional[str]:
+    """
+    Returns the canonical form of an IP address, or None if it is not one.
+    """
+    try:
+        return str(ipaddress.ip_address(address))
+    except ValueError:
+        return None
+
+
+def collect_addresses(results: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+    """
+    Builds the IP -> domains index from per-domain DNS results.
+
+    Args:
+        results (dict): Domain -> records, as returned by fetch_dns_records. Record
+                        types that hold an error string instead of a list are skipped.
+
+    Returns:
+        dict: Each unique address mapped to the sorted domains that resolve to it.
+    """
+    index: Dict[str, set] = {}
+    for domain, records in results.items():
+        for record_type in ADDRESS_TYPES:
+            addresses = records.get(record_type)
+            if not isinstance(addresses, list):
+                continue
+            for ip in map(normalize_address, addresses):
+                if ip is not None:
+                    index.setdefault(ip, set()).add(domain)
+    return {ip: sorted(domains) for ip, domains in sorted(index.items())}
+
+
+class PTRSweeper:
+    """
+    Resolves PTR names for many addresses concurrently, caching them by IP.
+
+    The cache is keyed by address and honours the PTR answer's TTL, so reusing
+    one sweeper across scans only queries addresses it has not seen recently.
+    """
+
+    def __init__(
+        self,
+        resolver: Optional[dns.asyncresolver.Resolver] = None,
+        concurrency: int = 100,
+        cache: Optional[TTLCache] = None,
+    ):
+        if resolver is None:
+            resolver = dns.asyncresolver.Resolver(configure=False)
+            resolver.nameservers = ['8.8.8.8', '1.1.1.1']
+        self.resolver = resolver
+        self.concurrency = concurrency
+        self.cache = cache if cache is not None else TTLCache(max_size=1000000)
+        self.queries_sent = 0
+
+    async def lookup(self, ip: str) -> Union[List[str], str]:
+        """
+        Fetches the PTR names for one address, or an error message.
+        """
+        cached = self.cache.get(ip)
+        if cached is not None:
+            return cached
+
+        self.queries_sent += 1
+        try:
+            answers = await self.resolver.resolve(dns.reversename.from_address(ip), 'PTR')
+            result, ttl = [rdata.to_text() for rdata in answers], answers.rrset.ttl
+        except dns.resolver.NoAnswer:
+            result, ttl = "No PTR records found.", NEGATIVE_TTL
+        except dns.resolver.NXDOMAIN:
+            result, ttl = f"No reverse DNS entry for {ip}.", NEGATIVE_TTL
+        except dns.resolver.LifetimeTimeout:
+            return "DNS query timed out. Please check your network."
+        except Exception as e:
+            return f"Error retrieving PTR records: {str(e)}"
+
+        self.cache.put(ip, result, ttl=ttl)
+        return result
+
+    async def sweep(self, addresses: Iterable[str]) -> Dict[str, Union[List[str], str]]:
+        """
+        Resolves PTR names for the unique addresses.
+
+        A fixed pool of workers pulls addresses from a shared iterator, so
+        `concurrency` queries stay in flight until the addresses run out.
+        """
+        pending = iter(dict.fromkeys(addresses))
+        names = {}
+
+        async def worker():
+            for ip in pending:
+                names[ip] = await self.lookup(ip)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return names
+
+
+async def enrich(results: Dict[str, Dict[str, Any]], sweeper: Optional[PTRSweeper] = None) -> Dict[str, Any]:
+    """
+    Adds PTR names to per-domain DNS results and builds the shared-hosting index.
+
+    Each address is queried once no matter how many domains resolve to it.
+
+    Returns:
+        dict: 'domains' with each domain's records plus a 'PTR' mapping of its
+              addresses to names, and 'ip_index' mapping each address to its
+              PTR names and the domains hosted on it.
+    """
+    sweeper = sweeper or PTRSweeper()
+    index = collect_addresses(results)
+    names = await sweeper.sweep(index)
+
+    domains = {}
+    for domain, records in results.items():
+        enriched = dict(records)
+        enriched['PTR'] = {
+            ip: names[ip]
+            for record_type in ADDRESS_TYPES if isinstance(records.get(record_type), list)
+            for ip in map(normalize_address, records[record_type]) if ip in names
+        }
+        domains[domain] = enriched
+
+    ip_index = {ip: {"PTR": names[ip], "domains": hosted} for ip, hosted in index.items()}
+    return {"domains": domains, "ip_index": ip_index}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Add PTR names and an IP -> domains index to scan results (JSON lines from query_planner.py)."
+    )
+    parser.add_argument('results', help="File with one {'domain': ..., 'dns': {...}} object per line ('-' for stdin).")
+    parser.add_argument('--concurrency', type=int, default=100, help="Concurrent PTR queries.")
+    parser.add_argument('--profile', metavar='DIR', help="Profile the run and write a report to DIR.")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.results == '-' else open(args.results)
+    with source:
+        results = {}
+        for line in source:
+            if line.strip():
+                entry = json.loads(line)
+                results[entry['domain']] = entry['dns']
+
+    async def run(profile):
+        if profile is not None:
+            profile.track_loop()
+        sweeper = PTRSweeper(concurrency=args.concurrency)
+        enriched = await enrich(results, sweeper)
+        print(
+            f"{len(results)} domains, {len(enriched['ip_index'])} unique addresses, "
+            f"{sweeper.queries_sent} PTR queries sent",
+            file=sys.stderr,
+        )
+        return enriched
+
+    with profile_run(args.profile) as profile:
+        enriched = asyncio.run(run(profile))
+    json.dump(enriched, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import dns.message
+import dns.name
+import dns.rdatatype
+import dns.resolver
+
+from domain_info_fetcher import fetch_whois, validate_domain
+from profiling import profile_run
+from result_store import ResultStore
+
+DEFAULT_RECORD_TYPES = ['A', 'NS', 'CNAME', 'MX', 'TXT']
+
+# Types whose answers are most likely to carry the CNAME chain are queried first.
+QUERY_ORDER = ['A', 'AAAA', 'MX', 'TXT', 'NS']
+
+
+def make_resolver() -> dns.resolver.Resolver:
+    """
+    Creates a resolver using Google and Cloudflare DNS servers.
+    """
+    resolver = dns.resolver.Resolver(configure=False)
+    resolver.nameservers = ['8.8.8.8', '1.1.1.1']
+    return resolver
+
+
+def nameservers_from_whois(whois_info: Optional[Dict[str, Any]], domain: str) -> Optional[List[str]]:
+    """
+    Returns the WHOIS nameservers in DNS presentation format, or None if unusable.
+
+    WHOIS lists the delegation of the registered domain, so the nameservers are
+    only used when the queried name is that domain; a subdomain such as
+    www.example.com may be delegated elsewhere or have no NS records at all.
+    """
+    if not whois_info or 'error' in whois_info:
+        return None
+    registered = whois_info.get('Domain Name')
+    if not registered or registered != domain.strip().lower().rstrip('.'):
+        return None
+    nameservers = whois_info.get('Nameservers')
+    if isinstance(nameservers, str):
+        nameservers = [nameservers]
+    if not nameservers:
+        return None
+    names = {str(ns).strip().lower().rstrip('.') + '.' for ns in nameservers if str(ns).strip()}
+    return sorted(names) or None
+
+
+def cname_from_response(domain: str, response: dns.message.Message) -> Optional[List[str]]:
+    """
+    Extracts the CNAME owned by the domain from a response's answer section.
+    """
+    qname = dns.name.from_text(domain)
+    for rrset in response.answer:
+        if rrset.rdtype == dns.rdatatype.CNAME and rrset.name == qname:
+            return [rdata.to_text() for rdata in rrset]
+    return None
+
+
+def plan_queries(record_types: Iterable[str], nameservers_known: bool = False) -> List[str]:
+    """
+    Orders the record types that must be sent on the wire.
+
+    CNAME is only queried directly when no other query can carry it, and NS is
+    skipped when it is already known from WHOIS.
+    """
+    requested = list(dict.fromkeys(t.upper() for t in record_types))
+    wire = [t for t in requested if t != 'CNAME' and not (t == 'NS' and nameservers_known)]
+    wire.sort(key=lambda t: QUERY_ORDER.index(t) if t in QUERY_ORDER else len(QUERY_ORDER))
+    if 'CNAME' in requested and not wire:
+        wire.append('CNAME')
+    return wire
+
+
+def fetch_dns_records_planned(
+    domain: str,
+    record_types: Optional[List[str]] = None,
+    whois_info: Optional[Dict[str, Any]] = None,
+    resolver: Optional[dns.resolver.Resolver] = None,
+) -> Tuple[Dict[str, Union[List[str], str]], Dict[str, Any]]:
+    """
+    Fetches the selected record types for a domain with as few queries as possible.
+
+    The CNAME chain is read from the first response that carries one, NS is taken
+    from WHOIS 'Nameservers' when the domain is the registered domain itself, and
+    an NXDOMAIN answer ends the plan since every other type would be NXDOMAIN too.
+
+    Returns:
+        tuple: The records in the same shape as fetch_dns_records, and a stats
+               dictionary with the number of queries sent, record types answered
+               and record types that failed.
+    """
+    requested = list(dict.fromkeys(t.upper() for t in (record_types or DEFAULT_RECORD_TYPES)))
+    resolver = resolver or make_resolver()
+    records: Dict[str, Union[List[str], str]] = {}
+    derived: Dict[str, str] = {}
+    failed = set()
+    queries_sent = 0
+
+    whois_nameservers = nameservers_from_whois(whois_info, domain) if 'NS' in requested else None
+    if whois_nameservers:
+        records['NS'] = whois_nameservers
+        derived['NS'] = 'WHOIS'
+
+    for record_type in plan_queries(requested, nameservers_known=bool(whois_nameservers)):
+        queries_sent += 1
+        try:
+            answer = resolver.resolve(domain, record_type, raise_on_no_answer=False)
+        except dns.resolver.NXDOMAIN as e:
+            # A dangling CNAME also ends in NXDOMAIN: the name itself exists,
+            # so its CNAME is still reported from the chain.
+            response = e.responses().get(dns.name.from_text(domain))
+            chain = cname_from_response(domain, response) if response is not None else None
+            if chain and 'CNAME' in requested and 'CNAME' not in records:
+                records['CNAME'] = chain
+                derived['CNAME'] = record_type
+            message = f"Domain '{domain}' does not exist."
+            for remaining in requested:
+                if remaining not in records:
+                    records[remaining] = message
+                    if remaining != record_type:
+                        derived[remaining] = f"{record_type} (NXDOMAIN)"
+            break
+        except dns.resolver.LifetimeTimeout:
+            records[record_type] = "DNS query timed out. Please check your network."
+            failed.add(record_type)
+            continue
+        except Exception as e:
+            records[record_type] = f"Error retrieving {record_type} records: {str(e)}"
+            failed.add(record_type)
+            continue
+
+        if answer.rrset is not None:
+            records[record_type] = [rdata.to_text() for rdata in answer.rrset]
+        else:
+            records[record_type] = f"No {record_type} records found."
+
+        if 'CNAME' in requested and 'CNAME' not in records:
+            records['CNAME'] = cname_from_response(domain, answer.response) or "No CNAME records found."
+            if record_type != 'CNAME':
+                derived['CNAME'] = record_type
+
+    if 'CNAME' in requested and 'CNAME' not in records:
+        # Every query carrying the chain failed, so ask for it directly.
+        queries_sent += 1
+        records['CNAME'], answered = fetch_cname(domain, resolver)
+        if not answered:
+            failed.add('CNAME')
+
+    stats = {
+        "queries_sent": queries_sent,
+        "record_types_returned": len(records) - len(failed),
+        "record_types_failed": len(failed),
+        "derived": derived,
+    }
+    return {record_type: records[record_type] for record_type in requested}, stats
+
+
+def fetch_cname(domain: str, resolver: dns.resolver.Resolver) -> Tuple[Union[List[str], str], bool]:
+    """
+    Fetches the CNAME records for the domain with a dedicated query.
+
+    Returns:
+        tuple: The records or a message, and whether the server answered.
+    """
+    try:
+        answers = resolver.resolve(domain, 'CNAME')
+        return [rdata.to_text() for rdata in answers], True
+    except dns.resolver.NoAnswer:
+        return "No CNAME records found.", True
+    except dns.resolver.NXDOMAIN:
+        return f"Domain '{domain}' does not exist.", True
+    except dns.resolver.LifetimeTimeout:
+        return "DNS query timed out. Please check your network.", False
+    except Exception as e:
+        return f"Error retrieving CNAME records: {str(e)}", False
+
+
+def summarize(stats: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Totals the queries sent and record types returned across many domains.
+
+    Record types that timed out or failed are counted separately and do not
+    count towards the queries saved.
+    """
+    totals = {
+        "domains": 0,
+        "queries_sent": 0,
+        "record_types_returned": 0,
+        "record_types_failed": 0,
+        "queries_saved": 0,
+    }
+    for entry in stats:
+        add_stats(totals, entry)
+    return totals
+
+
+def add_stats(totals: Dict[str, int], entry: Dict[str, Any]) -> None:
+    """
+    Adds one domain's stats to running totals made by summarize.
+    """
+    totals["domains"] += 1
+    totals["queries_sent"] += entry["queries_sent"]
+    totals["record_types_returned"] += entry["record_types_returned"]
+    totals["record_types_failed"] += entry["record_types_failed"]
+    totals["queries_saved"] = totals["record_types_returned"] - totals["queries_sent"]
+
+
+def plan_inventory(
+    domains: Iterable[str],
+    record_types: List[str],
+    with_whois: bool = False,
+    resolver: Optional[dns.resolver.Resolver] = None,
+) -> Iterator[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+    """
+    Fetches each valid domain in turn and yields (domain, result, stats).
+
+    The result holds 'dns' and, when with_whois is set, 'whois'. Nothing is
+    kept between domains, so the caller can stream an inventory of any size.
+    """
+    resolver = resolver or make_resolver()
+    for line in domains:
+        domain = line.strip().lower()
+        if not domain or not validate_domain(domain):
+            continue
+        whois_info = fetch_whois(domain) if with_whois else None
+        records, stats = fetch_dns_records_planned(domain, record_types, whois_info, resolver)
+        result = {"dns": records, "whois": whois_info} if with_whois else {"dns": records}
+        yield domain, result, stats
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Fetch DNS records for an inventory of domains with planned queries.")
+    parser.add_argument('domains', help="File with one domain per line ('-' for stdin).")
+    parser.add_argument('--types', default=','.join(DEFAULT_RECORD_TYPES), help="Comma separated record types.")
+    parser.add_argument('--whois', action='store_true', help="Fetch WHOIS first and reuse its nameservers for NS of registered domains.")
+    parser.add_argument('--store', help="Result store directory to merge this scan into as it runs.")
+    parser.add_argument('--profile', metavar='DIR', help="Profile the run and write a report to DIR.")
+    args = parser.parse_args(argv)
+
+    with profile_run(args.profile):
+        scan(args)
+
+
+def scan(args: argparse.Namespace) -> None:
+    """
+    Fetches every domain in the inventory and prints the results and query totals.
+    """
+    record_types = [t.strip() for t in args.types.split(',') if t.strip()]
+    source = sys.stdin if args.domains == '-' else open(args.domains)
+    totals = summarize([])
+
+    def results():
+        for domain, result, stats in plan_inventory(source, record_types, args.whois):
+            add_stats(totals, stats)
+            print(json.dumps({"domain": domain, "dns": result["dns"], "stats": stats}))
+            yield domain, result
+
+    with source:
+        if args.store:
+            # The store spools results to sorted runs as they are yielded.
+            with ResultStore(args.store) as store:
+                store.add_scan(results())
+        else:
+            for _ in results():
+                pass
+
+    print(
+        f"{totals['domains']} domains: {totals['queries_sent']} queries sent for "
+        f"{totals['record_types_returned']} answered record types ({totals['queries_saved']} saved, "
+        f"{totals['record_types_failed']} failed)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+import heapq
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+MAGIC = b'DQRS'
+VERSION = 1
+MANIFEST = 'MANIFEST'
+
+# magic, version, flags, count, fanout, index, reverse index, names, records
+HEADER = struct.Struct('<4sHHQQQQQQ')
+# name offset, name length, record offset, record length
+ENTRY = struct.Struct('<QIQI')
+FANOUT = struct.Struct('<257Q')
+REVERSE_ENTRY = struct.Struct('<I')
+# reversed name length, entry number; followed by the reversed name
+RUN_ENTRY = struct.Struct('<HI')
+# Names sorted in memory at a time when building the reversed-label index.
+RUN_SIZE = 1000000
+# name length, record length; followed by the name and the packed record
+RESULT_RUN_ENTRY = struct.Struct('<HI')
+# Scan results sorted in memory at a time when writing a segment.
+RESULT_RUN_SIZE = 50000
+
+
+def normalize_domain(domain: str) -> Optional[bytes]:
+    """
+    Returns the store key for a domain: lowercase, no trailing dot, IDNA encoded.
+
+    Returns None for names that cannot be encoded, e.g. with an empty label or
+    a label longer than 63 bytes.
+    """
+    try:
+        return domain.strip().lower().rstrip('.').encode('idna') or None
+    except UnicodeError:
+        return None
+
+
+def reverse_key(name: bytes) -> bytes:
+    """
+    Reverses the labels of a name so that domains sort by TLD, then zone.
+    """
+    return b'.'.join(reversed(name.split(b'.')))
+
+
+def write_segment(
+    path: str,
+    results: Union[Dict[str, Any], Iterable[Tuple[str, Any]]],
+    run_size: int = RESULT_RUN_SIZE,
+) -> int:
+    """
+    Writes scan results to a new segment file.
+
+    The file holds a 256-way fanout table on the first byte of each name, a
+    fixed-width index sorted by name, a second index sorted by reversed labels
+    for zone/TLD scans, the packed names and the packed JSON records.
+
+    Results are packed as they arrive and spilled to sorted runs of at most
+    run_size domains, which are merged into write_sorted, so a scan of any size
+    can be streamed in. Names that cannot be IDNA encoded are skipped.
+
+    Args:
+        path (str): The file to create. It is written beside and renamed into place.
+        results: A mapping or iterable of (domain, result) pairs. Later pairs win.
+        run_size (int): Domains held in memory before a run is spilled to disk.
+
+    Returns:
+        int: The number of domains written.
+    """
+    items = results.items() if isinstance(results, dict) else results
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.TemporaryDirectory(dir=directory, prefix='.spool-') as spool:
+        runs: List[str] = []
+        run: Dict[bytes, bytes] = {}
+        for domain, result in items:
+            name = normalize_domain(domain)
+            if name is None:
+                continue
+            run[name] = json.dumps(result, separators=(',', ':'), default=str).encode()
+            if len(run) >= run_size:
+                runs.append(_spill_results(os.path.join(spool, f'results-{len(runs)}'), run))
+                run = {}
+        if not runs:
+            return write_sorted(path, sorted(run.items()))
+        if run:
+            runs.append(_spill_results(os.path.join(spool, f'results-{len(runs)}'), run))
+            run = {}
+
+        run_files = [open(run_path, 'rb') for run_path in runs]
+        try:
+            return write_sorted(path, _merge_results(run_files))
+        finally:
+            for run_file in run_files:
+                run_file.close()
+
+
+def write_sorted(path: str, items: Iterable[Tuple[bytes, bytes]], run_size: int = RUN_SIZE) -> int:
+    """
+    Streams (name, packed record) pairs, sorted by name and unique, into a segment.
+
+    Names, records and index entries are spooled to temporary files beside the
+    segment, and the reversed-label order is built with an external merge sort
+    of runs of at most run_size names, so memory use does not grow with the
+    number of domains.
+
+    Returns:
+        int: The number of domains written.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.TemporaryDirectory(dir=directory, prefix='.spool-') as spool:
+        spool_path = lambda name: os.path.join(spool, name)
+        fanout = [0] * 257
+        count = names_size = records_size = 0
+        runs: List[str] = []
+        run: List[Tuple[bytes, int]] = []
+        last = None
+
+        with open(spool_path('names'), 'wb') as names_f, \
+                open(spool_path('records'), 'wb') as records_f, \
+                open(spool_path('index'), 'wb') as index_f:
+            for name, record in items:
+                if last is not None and name <= last:
+                    raise ValueError("Segment items must be sorted by name and unique.")
+                last = name
+                index_f.write(ENTRY.pack(names_size, len(name), records_size, len(record)))
+                names_f.write(name)
+                records_f.write(record)
+                names_size += len(name)
+                records_size += len(record)
+                fanout[name[0] + 1] += 1
+                run.append((reverse_key(name), count))
+                count += 1
+                if len(run) >= run_size:
+                    runs.append(_spill_run(spool_path(f'run-{len(runs)}'), run))
+                    run = []
+        if run:
+            runs.append(_spill_run(spool_path(f'run-{len(runs)}'), run))
+            run = []
+
+        for i in range(1, 257):
+            fanout[i] += fanout[i - 1]
+
+        fanout_off = HEADER.size
+        index_off = fanout_off + FANOUT.size
+        rindex_off = index_off + count * ENTRY.size
+        names_off = rindex_off + count * REVERSE_ENTRY.size
+        blob_off = names_off + names_size
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, count, fanout_off, index_off, rindex_off, names_off, blob_off))
+            f.write(FANOUT.pack(*fanout))
+
+            # Rebase the spooled index offsets onto the final layout.
+            with open(spool_path('index'), 'rb') as index_f:
+                while True:
+                    chunk = index_f.read(ENTRY.size * 65536)
+                    if not chunk:
+                        break
+                    f.write(b''.join(
+                        ENTRY.pack(names_off + name_pos, name_len, blob_off + record_pos, record_len)
+                        for name_pos, name_len, record_pos, record_len in ENTRY.iter_unpack(chunk)
+                    ))
+
+            run_files = [open(run_path, 'rb') for run_path in runs]
+            try:
+                for _rkey, i in heapq.merge(*(_read_run(run_file) for run_file in run_files)):
+                    f.write(REVERSE_ENTRY.pack(i))
+            finally:
+                for run_file in run_files:
+                    run_file.close()
+
+            for spooled in ('names', 'records'):
+                with open(spool_path(spooled), 'rb') as spooled_f:
+                    shutil.copyfileobj(spooled_f, f, 1024 * 1024)
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+
+def _spill_run(path: str, run: List[Tuple[bytes, int]]) -> str:
+    run.sort()
+    with open(path, 'wb') as f:
+        for rkey, i in run:
+            f.write(RUN_ENTRY.pack(len(rkey), i))
+            f.write(rkey)
+    return path
+
+
+def _read_run(f) -> Iterator[Tuple[bytes, int]]:
+    while True:
+        head = f.read(RUN_ENTRY.size)
+        if not head:
+            return
+        length, i = RUN_ENTRY.unpack(head)
+        yield f.read(length), i
+
+
+def _spill_results(path: str, run: Dict[bytes, bytes]) -> str:
+    with open(path, 'wb') as f:
+        for name in sorted(run):
+            record = run[name]
+            f.write(RESULT_RUN_ENTRY.pack(len(name), len(record)))
+            f.write(name)
+            f.write(record)
+    return path
+
+
+def _merge_results(run_files: List[Any]) -> Iterator[Tuple[bytes, bytes]]:
+    # Each run holds a name at most once; on ties the latest run wins.
+    def ranked(f, rank):
+        while True:
+            head = f.read(RESULT_RUN_ENTRY.size)
+            if not head:
+                return
+            name_len, record_len = RESULT_RUN_ENTRY.unpack(head)
+            yield f.read(name_len), rank, f.read(record_len)
+
+    streams = [ranked(f, -rank) for rank, f in enumerate(run_files)]
+    last_name = None
+    for name, _rank, record in heapq.merge(*streams):
+        if name == last_name:
+            continue
+        last_name = name
+        yield name, record
+
+
+class Segment:
+    """
+    A read-only, memory-mapped segment file.
+
+    Nothing is loaded up front: lookups binary search the fixed-width index
+    directly in the mapping, so resident memory stays small regardless of size.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path} is not a result store segment.")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _flags, self.count, fanout_off,
+         self._index_off, self._rindex_off, _names_off, _blob_off) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} result store segment.")
+        self._fanout = FANOUT.unpack_from(self._mm, fanout_off)
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def _entry(self, i: int) -> Tuple[int, int, int, int]:
+        return ENTRY.unpack_from(self._mm, self._index_off + i * ENTRY.size)
+
+    def name_at(self, i: int) -> bytes:
+        name_off, name_len, _, _ = self._entry(i)
+        return self._mm[name_off:name_off + name_len]
+
+    def raw_record_at(self, i: int) -> bytes:
+        _, _, record_off, record_len = self._entry(i)
+        return self._mm[record_off:record_off + record_len]
+
+    def record_at(self, i: int) -> Any:
+        return json.loads(self.raw_record_at(i))
+
+    def _reverse_at(self, j: int) -> int:
+        return REVERSE_ENTRY.unpack_from(self._mm, self._rindex_off + j * REVERSE_ENTRY.size)[0]
+
+    def _bisect(self, key: bytes, lo: int = 0, hi: Optional[int] = None) -> int:
+        hi = self.count if hi is None else hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, name: bytes) -> Optional[int]:
+        """
+        Returns the index of the name, or None if it is not in the segment.
+        """
+        if not name:
+            return None
+        lo, hi = self._fanout[name[0]], self._fanout[name[0] + 1]
+        i = self._bisect(name, lo, hi)
+        if i < hi and self.name_at(i) == name:
+            return i
+        return None
+
+    def iter_prefix(self, prefix: bytes) -> Iterator[Tuple[bytes, int]]:
+        """
+        Yields (name, index) for names starting with the prefix, in name order.
+        """
+        if prefix:
+            lo, hi = self._fanout[prefix[0]], self._fanout[prefix[0] + 1]
+        else:
+            lo, hi = 0, self.count
+        for i in range(self._bisect(prefix, lo, hi), hi):
+            name = self.name_at(i)
+            if not name.startswith(prefix):
+                break
+            yield name, i
+
+    def _bisect_reverse(self, key: bytes) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if reverse_key(self.name_at(self._reverse_at(mid))) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def iter_zone(self, zone: bytes) -> Iterator[Tuple[bytes, int]]:
+        """
+        Yields (reversed name, index) for the zone and every name below it.
+        """
+        key = reverse_key(zone)
+        j = self._bisect_reverse(key)
+        if j < self.count and reverse_key(self.name_at(self._reverse_at(j))) == key:
+            yield key, self._reverse_at(j)
+
+        # Siblings such as 'example-foo.com' sort between the zone and its
+        # subdomains, so the subdomain range is located separately.
+        below = key + b'.'
+        for j in range(self._bisect_reverse(below), self.count):
+            i = self._reverse_at(j)
+            rkey = reverse_key(self.name_at(i))
+            if not rkey.startswith(below):
+                break
+            yield rkey, i
+
+
+class ResultStore:
+    """
+    The last known result for every scanned domain, kept as a directory of segments.
+
+    Each scan is merged in by writing one new segment and listing it in the
+    manifest; older segments are never rewritten. Lookups consult the newest
+    segment first. Once more than max_segments accumulate they are compacted
+    into a single segment.
+    """
+
+    def __init__(self, directory: str, max_segments: int = 8):
+        self.directory = directory
+        self.max_segments = max_segments
+        os.makedirs(directory, exist_ok=True)
+        self.segments: List[Segment] = []
+        self._load_manifest()
+
+    def __enter__(self) -> 'ResultStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST)
+
+    def _segment_names(self) -> List[str]:
+        try:
+            with open(self._manifest_path()) as f:
+                return [line.strip() for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def _load_manifest(self) -> None:
+        self.close()
+        # Newest first, so the first hit is the last known state.
+        for name in reversed(self._segment_names()):
+            self.segments.append(Segment(os.path.join(self.directory, name)))
+
+    def _write_manifest(self, names: List[str]) -> None:
+        tmp_path = self._manifest_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(''.join(name + '\n' for name in names))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._manifest_path())
+
+    def _next_segment_name(self) -> str:
+        numbers = [int(name.split('.')[0].split('-')[1]) for name in self._segment_names()]
+        return f"segment-{max(numbers, default=0) + 1:06d}.dqrs"
+
+    def add_scan(self, results: Union[Dict[str, Any], Iterable[Tuple[str, Any]]]) -> int:
+        """
+        Merges the results of a scan into the store as a new segment.
+
+        The results may be a generator, so a scan can be streamed into the
+        store without being held in memory.
+
+        Returns:
+            int: The number of domains written.
+        """
+        name = self._next_segment_name()
+        count = write_segment(os.path.join(self.directory, name), results)
+        self._write_manifest(self._segment_names() + [name])
+        self._load_manifest()
+        if len(self.segments) > self.max_segments:
+            self.compact()
+        return count
+
+    def compact(self) -> None:
+        """
+        Rewrites all segments into one, keeping the newest result for each domain.
+        """
+        old_names = self._segment_names()
+        if len(old_names) <= 1:
+            return
+        name = self._next_segment_name()
+        write_sorted(os.path.join(self.directory, name), (
+            (key, segment.raw_record_at(i))
+            for key, segment, i in self._merged(segment.iter_prefix(b'') for segment in self.segments)
+        ))
+        self._write_manifest([name])
+        self._load_manifest()
+        for old_name in old_names:
+            os.remove(os.path.join(self.directory, old_name))
+
+    def get(self, domain: str) -> Optional[Any]:
+        """
+        Returns the last known result for the domain, or None if it was never scanned.
+        """
+        name = normalize_domain(domain)
+        if name is None:
+            return None
+        for segment in self.segments:
+            i = segment.find(name)
+            if i is not None:
+                return segment.record_at(i)
+        return None
+
+    def __contains__(self, domain: str) -> bool:
+        name = normalize_domain(domain)
+        if name is None:
+            return False
+        return any(segment.find(name) is not None for segment in self.segments)
+
+    def _merged(self, iterators: Iterable[Iterator[Tuple[bytes, int]]]) -> Iterator[Tuple[bytes, Segment, int]]:
+        # Ties on the key go to the lowest segment number, i.e. the newest segment.
+        def ranked(iterator, rank):
+            for key, i in iterator:
+                yield key, rank, i
+
+        streams = [ranked(iterator, rank) for rank, iterator in enumerate(iterators)]
+        last_key = None
+        for key, rank, i in heapq.merge(*streams):
+            if key == last_key:
+                continue
+            last_key = key
+            yield key, self.segments[rank], i
+
+    def scan_prefix(self, prefix: str) -> Iterator[Tuple[str, Any]]:
+        """
+        Yields (domain, result) for every domain starting with the prefix, sorted by name.
+        """
+        try:
+            key = prefix.strip().lower().encode('idna') if prefix else b''
+        except UnicodeError:
+            return
+        for name, segment, i in self._merged(segment.iter_prefix(key) for segment in self.segments):
+            yield name.decode('ascii'), segment.record_at(i)
+
+    def scan_zone(self, zone: str) -> Iterator[Tuple[str, Any]]:
+        """
+        Yields (domain, result) for the zone and all names below it, e.g. 'com'
+        for a whole TLD or 'example.com' for a domain and its subdomains.
+        """
+        key = normalize_domain(zone)
+        if key is None:
+            return
+        for rkey, segment, i in self._merged(segment.iter_zone(key) for segment in self.segments):
+            yield reverse_key(rkey).decode('ascii'), segment.record_at(i)
+
+    def __len__(self) -> int:
+        """
+        Returns the number of distinct domains. This walks every segment's index.
+        """
+        return sum(1 for _ in self._merged(segment.iter_prefix(b'') for segment in self.segments))
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+
+from result_store import ResultStore, Segment, normalize_domain, reverse_key, write_segment, write_sorted
+
+
+class ResultStoreTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = self._tmp.name
+        self.store = ResultStore(os.path.join(self.directory, 'store'))
+
+    def tearDown(self):
+        self.store.close()
+        self._tmp.cleanup()
+
+    def test_point_lookup(self):
+        self.store.add_scan({"Example.com.": {"dns": {"A": ["1.2.3.4"]}}, "other.org": {"dns": {}}})
+        self.assertEqual(self.store.get("example.com"), {"dns": {"A": ["1.2.3.4"]}})
+        self.assertIn("EXAMPLE.COM", self.store)
+        self.assertIsNone(self.store.get("missing.com"))
+        self.assertNotIn("missing.com", self.store)
+
+    def test_newest_segment_wins(self):
+        self.store.add_scan({"example.com": {"scan": 1}, "old.com": {"scan": 1}})
+        self.store.add_scan({"example.com": {"scan": 2}})
+        self.assertEqual(self.store.get("example.com"), {"scan": 2})
+        self.assertEqual(self.store.get("old.com"), {"scan": 1})
+        self.assertEqual(len(self.store), 2)
+
+    def test_later_pairs_in_a_scan_win(self):
+        self.store.add_scan([("example.com", {"scan": 1}), ("EXAMPLE.com.", {"scan": 2})])
+        self.assertEqual(self.store.get("example.com"), {"scan": 2})
+
+    def test_prefix_scan(self):
+        self.store.add_scan({"example.com": 1, "example.org": 2, "examine.net": 3, "other.com": 4})
+        self.store.add_scan({"example.org": 5})
+        self.assertEqual(list(self.store.scan_prefix("example.")), [("example.com", 1), ("example.org", 5)])
+
+    def test_zone_scan_skips_siblings(self):
+        self.store.add_scan({
+            "example.com": 1,
+            "www.example.com": 2,
+            "a.b.example.com": 3,
+            "example-foo.com": 4,
+            "badexample.com": 5,
+        })
+        self.store.add_scan({"mail.example.com": 6})
+        self.assertEqual(
+            sorted(self.store.scan_zone("example.com")),
+            [("a.b.example.com", 3), ("example.com", 1), ("mail.example.com", 6), ("www.example.com", 2)],
+        )
+        self.assertEqual(len(list(self.store.scan_zone("com"))), 6)
+
+    def test_compaction(self):
+        self.store.max_segments = 2
+        self.store.add_scan({"a.com": 1, "b.com": 1})
+        self.store.add_scan({"b.com": 2})
+        self.store.add_scan({"c.com": 3})
+        self.assertEqual(len(self.store.segments), 1)
+        self.assertEqual(
+            list(self.store.scan_prefix("")),
+            [("a.com", 1), ("b.com", 2), ("c.com", 3)],
+        )
+        files = [name for name in os.listdir(self.store.directory) if name.endswith('.dqrs')]
+        self.assertEqual(len(files), 1)
+
+    def test_invalid_names(self):
+        self.assertIsNone(normalize_domain("a..com"))
+        self.assertIsNone(normalize_domain("x" * 64 + ".com"))
+        count = self.store.add_scan({"a..com": 1, "x" * 64 + ".com": 2, "ok.com": 3})
+        self.assertEqual(count, 1)
+        self.assertIsNone(self.store.get("a..com"))
+        self.assertNotIn("x" * 64 + ".com", self.store)
+        self.assertEqual(list(self.store.scan_zone("a..com")), [])
+
+    def test_write_segment_with_multiple_runs(self):
+        path = os.path.join(self.directory, 'runs.dqrs')
+        results = [(f"host{i % 40}.example.com", i) for i in range(100)]
+        self.assertEqual(write_segment(path, results, run_size=7), 40)
+        segment = Segment(path)
+        try:
+            names = [segment.name_at(i) for i in range(segment.count)]
+            self.assertEqual(names, sorted(names))
+            self.assertEqual(segment.record_at(segment.find(b"host3.example.com")), 83)
+        finally:
+            segment.close()
+
+    def test_write_sorted_with_multiple_runs(self):
+        path = os.path.join(self.directory, 'sorted.dqrs')
+        names = sorted(
+            f"{label}.{tld}".encode() for label in ('a', 'b', 'mail', 'www') for tld in ('com', 'net', 'org')
+        )
+        self.assertEqual(write_sorted(path, ((name, b'1') for name in names), run_size=2), len(names))
+        segment = Segment(path)
+        try:
+            reversed_order = [reverse_key(segment.name_at(segment._reverse_at(j))) for j in range(segment.count)]
+            self.assertEqual(reversed_order, sorted(reverse_key(name) for name in names))
+            self.assertEqual(sorted(name for name, _ in segment.iter_zone(b'net')), sorted(
+                reverse_key(name) for name in names if name.endswith(b'.net')
+            ))
+        finally:
+            segment.close()
+        self.assertEqual(sorted(os.listdir(self.directory)), ['sorted.dqrs', 'store'])
+
+    def test_write_sorted_rejects_unsorted_input(self):
+        with self.assertRaises(ValueError):
+            write_sorted(os.path.join(self.directory, 'bad.dqrs'), [(b'b.com', b'1'), (b'a.com', b'1')])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,255 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional
+
+
+class Lookup(NamedTuple):
+    value: Any
+    stale: bool
+    age: float
+    refreshing: bool = False
+
+
+class LoadError(Exception):
+    """
+    Raised when the loader returns a value that is_error marks as a failure.
+    """
+
+    def __init__(self, key: Hashable, value: Any):
+        super().__init__(f"Loading {key!r} failed.")
+        self.key = key
+        self.value = value
+
+
+class Entry:
+    __slots__ = ('value', 'fetched_at', 'fresh_until', 'expires_at', 'hits', 'last_hit', 'retry_at')
+
+    def __init__(self, value: Any, fresh_for: float, serve_stale_for: float):
+        now = time.monotonic()
+        self.value = value
+        self.fetched_at = now
+        self.fresh_until = now + fresh_for
+        self.expires_at = self.fresh_until + serve_stale_for
+        self.hits = 0.0
+        self.last_hit = now
+        self.retry_at = 0.0
+
+
+class StaleWhileRevalidate:
+    """
+    Serves the last known result for a key immediately and refreshes it in the background.
+
+    A fresh result is returned as is. A result past its freshness is returned
+    flagged as stale while a background refresh runs; only missing or expired
+    keys wait on the loader. Popular keys are refreshed shortly before they go
+    stale, and no more than max_refreshes background refreshes run at once.
+    A failed load, whether the loader raises or is_error flags its value, is
+    never cached: the previous result is kept and the key is not refreshed
+    again for retry_after seconds.
+
+    Args:
+        loader: Blocking function that fetches the value for a key. It runs in
+                the default executor.
+        fresh_for (float): Seconds a result is served without refreshing.
+        ttl_for: Optional function returning the freshness for a loaded value
+                 (e.g. the smallest DNS TTL), or None to use fresh_for.
+        is_error: Optional function telling whether a loaded value is a failure,
+                  for loaders that report errors instead of raising.
+        serve_stale_for (float): Seconds past freshness a stale result is still served.
+        refresh_ahead (float): How long before going stale a popular key is refreshed.
+        popular_hits (float): Decayed request count at which a key counts as popular.
+        hit_half_life (float): Seconds for a key's request count to halve.
+        max_refreshes (int): Background refreshes allowed to run at once.
+        retry_after (float): Seconds to wait before refreshing a key whose refresh failed.
+        refresh_interval (float): Seconds between checks for popular keys to refresh.
+        max_entries (int): Least recently used keys beyond this are dropped.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[Hashable], Any],
+        fresh_for: float = 300.0,
+        ttl_for: Optional[Callable[[Any], Optional[float]]] = None,
+        is_error: Optional[Callable[[Any], bool]] = None,
+        serve_stale_for: float = 24 * 3600.0,
+        refresh_ahead: float = 30.0,
+        popular_hits: float = 3.0,
+        hit_half_life: float = 600.0,
+        max_refreshes: int = 4,
+        retry_after: float = 60.0,
+        refresh_interval: float = 5.0,
+        max_entries: int = 1000,
+    ):
+        self.loader = loader
+        self.fresh_for = fresh_for
+        self.ttl_for = ttl_for
+        self.is_error = is_error
+        self.serve_stale_for = serve_stale_for
+        self.refresh_ahead = refresh_ahead
+        self.popular_hits = popular_hits
+        self.hit_half_life = hit_half_life
+        self.max_refreshes = max_refreshes
+        self.retry_after = retry_after
+        self.refresh_interval = refresh_interval
+        self.max_entries = max_entries
+
+        self._entries: "OrderedDict[Hashable, Entry]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._background = 0
+        self._refresher: Optional[asyncio.Task] = None
+
+    async def get(
+        self,
+        key: Hashable,
+        refresh: bool = False,
+        on_refresh: Optional[Callable[[Lookup], Any]] = None,
+    ) -> Lookup:
+        """
+        Returns the result for the key, fetching it only if nothing usable is cached.
+
+        Args:
+            key: The key to look up, e.g. a domain name.
+            refresh (bool): Wait for a live result even if a cached one is available.
+            on_refresh: Called with the new result when a stale result is returned
+                        and its background refresh succeeds.
+
+        Returns:
+            Lookup: The value, whether it is stale, its age in seconds and whether
+                    a background refresh is running for it.
+
+        Raises:
+            LoadError: If the key had to be loaded and is_error flagged the value.
+        """
+        self._start_refresher()
+        now = time.monotonic()
+        entry = self._entries.get(key)
+
+        if entry is not None and not refresh and now < entry.expires_at:
+            self._record_hit(key, entry, now)
+            stale = now >= entry.fresh_until
+            if stale:
+                self._refresh_in_background(key)
+            refreshing = stale and key in self._inflight
+            if refreshing and on_refresh is not None:
+                self._inflight[key].add_done_callback(lambda f: self._notify(f, on_refresh))
+            return Lookup(entry.value, stale, now - entry.fetched_at, refreshing)
+
+        entry = await self._load(key)
+        self._record_hit(key, entry, time.monotonic())
+        return Lookup(entry.value, False, 0.0)
+
+    def peek(self, key: Hashable) -> Optional[Lookup]:
+        """
+        Returns the cached result without fetching, refreshing or counting a hit.
+        """
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is None or now >= entry.expires_at:
+            return None
+        return Lookup(entry.value, now >= entry.fresh_until, now - entry.fetched_at)
+
+    @staticmethod
+    def _notify(future: "asyncio.Future[Entry]", on_refresh: Callable[[Lookup], Any]) -> None:
+        if future.cancelled() or future.exception() is not None:
+            return
+        on_refresh(Lookup(future.result().value, False, 0.0))
+
+    def _record_hit(self, key: Hashable, entry: Entry, now: float) -> None:
+        decay = 0.5 ** ((now - entry.last_hit) / self.hit_half_life)
+        entry.hits = entry.hits * decay + 1
+        entry.last_hit = now
+        if key in self._entries:
+            self._entries.move_to_end(key)
+
+    def _load(self, key: Hashable) -> "asyncio.Future[Entry]":
+        """
+        Starts loading the key, or joins the load already running for it.
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(key))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _f: self._inflight.pop(key, None))
+        return asyncio.shield(future)
+
+    async def _fetch(self, key: Hashable) -> Entry:
+        loop = asyncio.get_running_loop()
+        try:
+            value = await loop.run_in_executor(None, self.loader, key)
+            if self.is_error is not None and self.is_error(value):
+                raise LoadError(key, value)
+        except Exception:
+            # The last good result keeps being served until it expires, and
+            # the key is left alone for retry_after seconds.
+            failed = self._entries.get(key)
+            if failed is not None:
+                failed.retry_at = time.monotonic() + self.retry_after
+            raise
+
+        fresh_for = self.ttl_for(value) if self.ttl_for else None
+        entry = Entry(value, self.fresh_for if fresh_for is None else fresh_for, self.serve_stale_for)
+        previous = self._entries.get(key)
+        if previous is not None:
+            entry.hits, entry.last_hit = previous.hits, previous.last_hit
+
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def _refresh_in_background(self, key: Hashable) -> bool:
+        """
+        Schedules a refresh unless one is running, the key is backing off after a
+        failure, or the refresh budget is used up.
+        """
+        if key in self._inflight or self._background >= self.max_refreshes:
+            return False
+        entry = self._entries.get(key)
+        if entry is not None and entry.retry_at > time.monotonic():
+            return False
+
+        self._background += 1
+        future = self._load(key)
+
+        def done(f):
+            self._background -= 1
+            # _fetch has already backed off; the error is only retrieved so
+            # it is not logged as unhandled.
+            if not f.cancelled():
+                f.exception()
+
+        future.add_done_callback(done)
+        return True
+
+    def _start_refresher(self) -> None:
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.ensure_future(self._refresh_popular())
+
+    async def _refresh_popular(self) -> None:
+        """
+        Periodically refreshes popular keys that are about to go stale.
+        """
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            now = time.monotonic()
+            due = []
+            for key, entry in self._entries.items():
+                hits = entry.hits * 0.5 ** ((now - entry.last_hit) / self.hit_half_life)
+                if entry.retry_at > now:
+                    continue
+                if hits >= self.popular_hits and entry.fresh_until - now <= self.refresh_ahead:
+                    due.append((hits, key))
+            for _hits, key in sorted(due, key=lambda item: item[0], reverse=True):
+                if self._background >= self.max_refreshes:
+                    break
+                self._refresh_in_background(key)
+
+    def close(self) -> None:
+        """
+        Stops the proactive refresh loop.
+        """
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
@@ -1,6 +1,28 @@
 import flet as ft
-from whois import fetch_whois_info
-from dns import fetch_dns_records
+from utils import is_valid_domain, fetch_whois, fetch_dns_records
+from serving import LoadError, StaleWhileRevalidate
+
+
+def load_domain(domain):
+    """
+    Fetches the WHOIS and DNS data shown for a domain.
+    """
+    return {"whois": fetch_whois(domain), "dns": fetch_dns_records(domain)}
+
+
+def lookup_failed(data):
+    """
+    Tells whether a lookup got nothing back: WHOIS failed and no DNS record type
+    returned records, e.g. during a network outage.
+    """
+    whois_failed = not data["whois"] or "error" in data["whois"]
+    return whois_failed and not any(isinstance(records, list) for records in data["dns"].values())
+
+
+# Shared by every page, so a domain looked at recently is served instantly.
+# Failed lookups are not cached and never replace data that was already shown.
+domain_lookups = StaleWhileRevalidate(load_domain, fresh_for=300, refresh_ahead=60, is_error=lookup_failed)
+
 
 def build_ui(page: ft.Page):
     # Status bar
@@ -22,52 +44,86 @@ def build_ui(page: ft.Page):
         status_bar.value = message
         page.update()
 
-    async def fetch_data(e):
-        domain = domain_input.value.strip()
+    # The domain whose data is on screen, so a late background refresh for a
+    # domain the user has moved away from is not drawn.
+    shown = {"domain": None}
+
+    def show_data(domain, data):
+        whois_info = data["whois"]
+        dns_info = data["dns"]
+        shown["domain"] = domain
+
+        # Clear previous content
+        whois_content.controls.clear()
+        dns_content.controls.clear()
+
+        # Populate WHOIS data
+        if whois_info:
+            for key, value in whois_info.items():
+                whois_content.controls.append(
+                    ft.Card(
+                        content=ft.Row([ft.Text(key), ft.Text(str(value))], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                        elevation=2,
+                    )
+                )
+
+        # Populate DNS data
+        for record_type, records in dns_info.items():
+            # Missing records and errors come back as a single message.
+            if isinstance(records, str):
+                records = [records]
+            dns_content.controls.append(
+                ft.ExpansionTile(
+                    title=ft.Text(record_type),
+                    controls=[ft.Text(record) for record in records],
+                )
+            )
+
+    def on_refresh(domain):
+        def redraw(lookup):
+            if shown["domain"] == domain:
+                show_data(domain, lookup.value)
+                update_status("Ready")
+        return redraw
+
+    async def fetch_data(e, refresh=False):
+        domain = domain_input.value.strip().lower()
         if not domain:
             update_status("Error: Invalid Domain")
             return
+        if not is_valid_domain(domain):
+            update_status("Invalid domain format.")
+            return
 
-        loading_indicator.visible = True
-        update_status("Fetching Data...")
-        page.update()
+        if refresh or domain_lookups.peek(domain) is None:
+            loading_indicator.visible = True
+            update_status("Fetching Data...")
+            page.update()
 
         try:
-            whois_info = await fetch_whois_info(domain)
-            dns_info = await fetch_dns_records(domain)
-
-            # Clear previous content
-            whois_content.controls.clear()
-            dns_content.controls.clear()
-
-            # Populate WHOIS data
-            if whois_info:
-                for key, value in whois_info.items():
-                    whois_content.controls.append(
-                        ft.Card(
-                            content=ft.Row([ft.Text(key), ft.Text(value)], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
-                            elevation=2,
-                        )
-                    )
-
-            # Populate DNS data
-            for record_type, records in dns_info.items():
-                dns_content.controls.append(
-                    ft.Collapsible(
-                        label=record_type,
-                        content=ft.Column([ft.Text(record) for record in records]),
-                    )
-                )
-
-            update_status("Ready")
+            lookup = await domain_lookups.get(domain, refresh=refresh, on_refresh=on_refresh(domain))
+            show_data(domain, lookup.value)
+
+            if lookup.stale:
+                age = f"Showing data from {int(lookup.age // 60)} min ago"
+                update_status(f"{age}, refreshing in background" if lookup.refreshing else age)
+            else:
+                update_status("Ready")
+        except LoadError as e:
+            # Nothing is cached for the failure; show the errors it returned.
+            show_data(domain, e.value)
+            update_status("Error: Lookup failed. Please check your network.")
         except Exception as e:
             update_status(f"Error: {str(e)}")
 
         loading_indicator.visible = False
         page.update()
 
+    async def refresh_data(e):
+        await fetch_data(e, refresh=True)
+
     fetch_button.on_click = fetch_data
-    refresh_button.on_click = fetch_data
+    refresh_button.on_click = refresh_data
 
     # Dark/Light mode toggle
     def toggle_theme(e):
@@ -99,6 +155,9 @@ def build_ui(page: ft.Page):
     )
 
     # Keyboard Navigation
-    page.on_key_down = lambda e: (
-        tabs.selected_index = (tabs.selected_index + 1) % len(tabs.tabs) if e.key == ft.KeyCode.TAB else None
-    )
+    def next_tab(e):
+        if e.key == ft.KeyCode.TAB:
+            tabs.selected_index = (tabs.selected_index + 1) % len(tabs.tabs)
+            page.update()
+
+    page.on_key_down = next_tab